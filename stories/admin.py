@@ -1,29 +1,92 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.postgres.search import SearchQuery
+from django.db.models import Q
+from django.db.models.functions import Left
 from .models import Story, FlashCard, CardConnection
 
 
+class SearchVectorAdminMixin:
+    """
+    Admin search that matches the model's text through its GIN-indexed
+    ``search_vector`` column, or related fields through ``search_fields``.
+    """
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        
+        related_matches, _ = super().get_search_results(
+            request, self.model._default_manager.all(), search_term
+        )
+        return queryset.filter(
+            Q(search_vector=SearchQuery(search_term, search_type='websearch'))
+            | Q(pk__in=related_matches.values('pk'))
+        ), False
+
+
+class StoryListFilter(admin.RelatedFieldListFilter):
+    """
+    Story filter that lists its choices in one query.
+    
+    The default builds them with str() on every story, and Story.__str__
+    reads the owner, so each story would cost an extra query.
+    """
+    
+    def field_choices(self, field, request, model_admin):
+        stories = Story.objects.select_related('owner').only('title', 'owner__username')
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        if ordering:
+            stories = stories.order_by(*ordering)
+        return [(story.pk, str(story)) for story in stories]
+
+
 @admin.register(Story)
-class StoryAdmin(admin.ModelAdmin):
+class StoryAdmin(SearchVectorAdminMixin, admin.ModelAdmin):
     """Admin configuration for Story model."""
     list_display = ['title', 'owner', 'created_at', 'updated_at']
+    list_select_related = ['owner']
     list_filter = ['created_at', 'updated_at']
-    search_fields = ['title', 'initial_prompt', 'owner__username', 'owner__email']
+    # initial_prompt is searched through search_vector; title also by substring
+    search_fields = ['title', 'owner__username', 'owner__email']
     readonly_fields = ['created_at', 'updated_at']
     date_hierarchy = 'created_at'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('search_vector')
+
+
+class FlashCardChangeList(ChangeList):
+    """
+    Change list that loads only the first 101 characters of each card, enough
+    to render the preview. The change and delete views keep full rows.
+    """
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(
+            'content_text', 'embedding', 'search_vector',
+            'story__initial_prompt', 'story__search_vector'
+        ).annotate(content_head=Left('content_text', 101))
 
 
 @admin.register(FlashCard)
-class FlashCardAdmin(admin.ModelAdmin):
+class FlashCardAdmin(SearchVectorAdminMixin, admin.ModelAdmin):
     """Admin configuration for FlashCard model."""
     list_display = ['id', 'story', 'content_preview', 'has_image', 'created_at']
-    list_filter = ['created_at', 'updated_at', 'story']
-    search_fields = ['content_text', 'story__title']
+    # Story.__str__ renders the owner's username
+    list_select_related = ['story__owner']
+    list_filter = ['created_at', 'updated_at', ('story', StoryListFilter)]
+    # content_text is searched through search_vector
+    search_fields = ['story__title']
     readonly_fields = ['created_at', 'updated_at']
     date_hierarchy = 'created_at'
     
+    def get_changelist(self, request, **kwargs):
+        return FlashCardChangeList
+    
     def content_preview(self, obj):
         """Show a preview of the content text."""
-        return obj.content_text[:100] + '...' if len(obj.content_text) > 100 else obj.content_text
+        return obj.content_head[:100] + '...' if len(obj.content_head) > 100 else obj.content_head
     content_preview.short_description = 'Content Preview'
     
     def has_image(self, obj):
@@ -37,7 +100,22 @@ class FlashCardAdmin(admin.ModelAdmin):
 class CardConnectionAdmin(admin.ModelAdmin):
     """Admin configuration for CardConnection model."""
     list_display = ['id', 'story', 'source_card', 'target_card', 'created_at']
-    list_filter = ['created_at', 'story']
+    # FlashCard.__str__ renders its story title, Story.__str__ the owner's username
+    list_select_related = ['story__owner', 'source_card__story', 'target_card__story']
+    list_filter = ['created_at', ('story', StoryListFilter)]
     search_fields = ['story__title', 'source_card__content_text', 'target_card__content_text']
+    # Plain id inputs instead of <select> widgets listing every card and story
+    raw_id_fields = ['story', 'source_card', 'target_card']
     readonly_fields = ['created_at']
-    date_hierarchy = 'created_at' 
\ No newline at end of file
+    date_hierarchy = 'created_at'
+    
+    def get_queryset(self, request):
+        # The list only renders ids, story titles and owner usernames
+        return super().get_queryset(request).defer(
+            'story__initial_prompt', 'story__search_vector',
+            'source_card__content_text', 'source_card__embedding', 'source_card__search_vector',
+            'source_card__story__initial_prompt', 'source_card__story__search_vector',
+            'target_card__content_text', 'target_card__embedding', 'target_card__search_vector',
+            'target_card__story__initial_prompt', 'target_card__story__search_vector'
+        )
+ 
\ No newline at end of file
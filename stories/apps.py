@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class StoriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'stories' 
\ No newline at end of file
+    name = 'stories'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
+ 
\ No newline at end of file
@@ -0,0 +1,48 @@
+from django.contrib.postgres.search import SearchVector
+from django.core.management.base import BaseCommand
+from stories.models import Story, FlashCard
+
+# Same weights as Story.save() and FlashCard.build_search_vector()
+SEARCH_VECTORS = {
+    Story: SearchVector('title', weight='A') + SearchVector('initial_prompt', weight='B'),
+    FlashCard: SearchVector('content_text', weight='A'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in the full-text search_vector of stories and flashcards saved before "
+        "the column existed. Needed once after upgrading; admin search only matches "
+        "rows that have a search_vector."
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recompute every row instead of only rows without a search_vector'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows updated per UPDATE statement'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, search_vector in SEARCH_VECTORS.items():
+            queryset = model.objects.order_by('pk')
+            if not options['all']:
+                queryset = queryset.filter(search_vector__isnull=True)
+            
+            # Short UPDATEs keep row locks brief on large tables
+            updated = 0
+            last_pk = 0
+            while True:
+                pks = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                updated += model.objects.filter(pk__in=pks).update(search_vector=search_vector)
+                last_pk = pks[-1]
+            
+            self.stdout.write(self.style.SUCCESS(
+                f"Updated search_vector of {updated} {str(model._meta.verbose_name_plural).lower()}"
+            ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from stories.models import Story
+from stories.tasks import recalculate_story_embeddings_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue embedding recalculation for every flashcard of the given stories "
+        "(all stories by default). Needed once after upgrading from un-normalized "
+        "embeddings, which the inner-product RAG search cannot rank correctly."
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('story_ids', nargs='*', type=int, help='IDs of the stories to recalculate')
+    
+    def handle(self, *args, **options):
+        stories = Story.objects.order_by('pk')
+        if options['story_ids']:
+            stories = stories.filter(pk__in=options['story_ids'])
+        
+        count = 0
+        for story_id in stories.values_list('pk', flat=True).iterator():
+            recalculate_story_embeddings_task.delay(story_id)
+            count += 1
+        
+        self.stdout.write(self.style.SUCCESS(f"Queued embedding recalculation for {count} stories"))
@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
-from pgvector.django import VectorField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from pgvector.django import HalfVectorField, HnswIndex
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -13,35 +15,75 @@ class Story(models.Model):
     initial_prompt = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Full-text index over title and prompt, kept in sync by save()
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Stories'
+        indexes = [
+            GinIndex(name='story_search_gin', fields=['search_vector']),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.owner.username}"
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'title', 'initial_prompt'} & set(update_fields):
+            self.search_vector = (
+                SearchVector(models.Value(self.title), weight='A')
+                + SearchVector(models.Value(self.initial_prompt), weight='B')
+            )
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_vector'}
+        super().save(*args, **kwargs)
 
 
 class FlashCard(models.Model):
     """Model representing a story segment (flashcard) with vector embedding."""
     story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='flashcards')
     content_text = models.TextField()
-    embedding = VectorField(dimensions=384)  # For all-MiniLM-L6-v2 model
+    embedding = HalfVectorField(dimensions=384)  # L2-normalized all-MiniLM-L6-v2 vector, stored as FP16
     image_url = models.URLField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Full-text index over content_text, kept in sync by save()
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            GinIndex(name='fc_search_gin', fields=['search_vector']),
+            # Approximate nearest neighbour index used by the RAG search
+            HnswIndex(
+                name='fc_emb_hnsw',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['halfvec_ip_ops'],
+            ),
+        ]
     
     def __str__(self):
         return f"Card {self.id} in {self.story.title}"
     
+    @staticmethod
+    def build_search_vector(content_text):
+        """
+        Build the search_vector expression for the given content.
+        
+        The text is passed as a value rather than a column reference so the
+        expression can be used in INSERTs, including bulk_create.
+        """
+        return SearchVector(models.Value(content_text), weight='A')
+    
     def save(self, *args, **kwargs):
-        # Generate embedding if not provided
-        if not self.embedding:
-            from .utils import generate_embedding
-            self.embedding = generate_embedding(self.content_text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content_text' in update_fields:
+            self.search_vector = self.build_search_vector(self.content_text)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_vector'}
         super().save(*args, **kwargs)
 
 
@@ -55,13 +97,24 @@ class CardConnection(models.Model):
     class Meta:
         unique_together = ['source_card', 'target_card']
         ordering = ['created_at']
+        constraints = [
+            models.CheckConstraint(
+                check=~models.Q(source_card=models.F('target_card')),
+                name='cardconnection_no_self_loop',
+                violation_error_message="A card cannot connect to itself",
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.source_card.id} -> {self.target_card.id} in {self.story.title}"
+        return f"{self.source_card_id} -> {self.target_card_id} in {self.story.title}"
     
     def clean(self):
         from django.core.exceptions import ValidationError
-        if self.source_card.story != self.target_card.story:
-            raise ValidationError("Source and target cards must belong to the same story")
-        if self.source_card == self.target_card:
-            raise ValidationError("A card cannot connect to itself") 
\ No newline at end of file
+        if None in (self.story_id, self.source_card_id, self.target_card_id):
+            return
+        # Compare story ids in one query instead of loading both cards and their stories
+        story_ids = set(FlashCard.objects.filter(
+            pk__in=[self.source_card_id, self.target_card_id]
+        ).values_list('story_id', flat=True))
+        if story_ids != {self.story_id}:
+            raise ValidationError("Source and target cards must belong to the same story") 
\ No newline at end of file
@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Story
+
+
+@receiver(post_delete, sender=Story)
+def drop_story_ann_index(sender, instance, **kwargs):
+    """Drop the deleted story's partial ANN index once the delete is committed."""
+    from .tasks import drop_story_ann_index_task
+    story_id = instance.pk
+    transaction.on_commit(lambda: drop_story_ann_index_task.delay(story_id))
@@ -1,30 +1,52 @@
-from celery import shared_task
+from celery import group, shared_task
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from .models import Story, FlashCard, CardConnection
 from .utils import (
     generate_embedding, 
     generate_story_segment, 
     generate_image, 
-    perform_rag_search
+    perform_rag_search,
+    create_flashcards,
+    create_story_ann_index,
+    drop_story_ann_index
 )
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
-def generate_story_segment_task(story_id: int, user_prompt: str, parent_card_id: int = None):
+def index_story_if_large(story_id: int, added: int = 1):
+    """
+    Queue a per-story ANN index when a story grows past
+    ``settings.STORY_ANN_INDEX_THRESHOLD`` flashcards.
+    
+    Args:
+        story_id: ID of the story
+        added: Number of flashcards that were just added
+    """
+    count = FlashCard.objects.filter(story_id=story_id).count()
+    if count - added < settings.STORY_ANN_INDEX_THRESHOLD <= count:
+        build_story_ann_index_task.delay(story_id)
+
+
+@shared_task(bind=True)
+def generate_story_segment_task(self, story_id: int, user_prompt: str, parent_card_id: int = None):
     """
     Celery task to generate a new story segment using RAG pipeline.
     
+    Runs on the 'embed' queue: it encodes the prompt and retrieves context,
+    then replaces itself with write_story_segment_task (LLM call, gevent
+    queue) followed by save_story_segment_task (embedding, 'embed' queue).
+    The replacement inherits this task's id, so its result is the one
+    returned by save_story_segment_task.
+    
     Args:
         story_id: ID of the story
         user_prompt: User's prompt for continuing the story
         parent_card_id: ID of the parent card to connect from
     """
     try:
-        story = Story.objects.get(id=story_id)
-        
         # Generate embedding for user prompt
         query_embedding = generate_embedding(user_prompt)
         
@@ -32,20 +54,68 @@ def generate_story_segment_task(story_id: int, user_prompt: str, parent_card_id:
         context_segments = perform_rag_search(story_id, query_embedding, top_k=5)
         context = "\n\n".join(context_segments) if context_segments else "No previous context available."
         
-        # Generate story segment using LLM
+    except Exception as e:
+        logger.error(f"Error generating story segment for story {story_id}: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    
+    return self.replace(
+        write_story_segment_task.s(context, user_prompt)
+        | save_story_segment_task.s(story_id, parent_card_id)
+    )
+
+
+@shared_task
+def write_story_segment_task(context: str, user_prompt: str):
+    """
+    Celery task to write a story segment with the LLM.
+    
+    Args:
+        context: Previous story segments relevant to the prompt
+        user_prompt: User's prompt for continuing the story
+    """
+    try:
         generated_text = generate_story_segment(context, user_prompt)
         
-        # Create new flashcard
+        return {
+            'success': True,
+            'generated_text': generated_text
+        }
+        
+    except Exception as e:
+        logger.error(f"Error writing story segment: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+@shared_task
+def save_story_segment_task(segment: dict, story_id: int, parent_card_id: int = None):
+    """
+    Celery task to store a written story segment as a flashcard.
+    
+    Args:
+        segment: Result of write_story_segment_task
+        story_id: ID of the story
+        parent_card_id: ID of the parent card to connect from
+    """
+    if not segment['success']:
+        return segment
+    
+    try:
+        story = Story.objects.get(id=story_id)
+        generated_text = segment['generated_text']
+        
+        # Create new flashcard with the embedding of the generated text
         new_card = FlashCard.objects.create(
             story=story,
             content_text=generated_text,
-            embedding=query_embedding  # We'll update this with the actual text embedding
+            embedding=generate_embedding(generated_text)
         )
         
-        # Update embedding with the actual generated text
-        new_card.embedding = generate_embedding(generated_text)
-        new_card.save()
-        
         # Create connection if parent card exists
         if parent_card_id:
             try:
@@ -58,6 +128,8 @@ def generate_story_segment_task(story_id: int, user_prompt: str, parent_card_id:
             except ObjectDoesNotExist:
                 logger.warning(f"Parent card {parent_card_id} not found for story {story_id}")
         
+        index_story_if_large(story_id)
+        
         logger.info(f"Successfully generated story segment for story {story_id}")
         return {
             'success': True,
@@ -66,7 +138,7 @@ def generate_story_segment_task(story_id: int, user_prompt: str, parent_card_id:
         }
         
     except Exception as e:
-        logger.error(f"Error generating story segment for story {story_id}: {e}")
+        logger.error(f"Error saving story segment for story {story_id}: {e}")
         return {
             'success': False,
             'error': str(e)
@@ -140,36 +212,141 @@ def recalculate_embedding_task(flashcard_id: int):
 
 
 @shared_task
-def create_initial_story_task(story_id: int):
+def recalculate_story_embeddings_task(story_id: int):
+    """
+    Celery task to recalculate embeddings for every flashcard in a story.
+    
+    The per-card tasks are submitted as one group so they share a single
+    broker connection instead of one round-trip per card.
+    
+    Args:
+        story_id: ID of the story
+    """
+    flashcard_ids = FlashCard.objects.filter(
+        story_id=story_id
+    ).values_list('id', flat=True)
+    
+    result = group([
+        recalculate_embedding_task.s(flashcard_id) for flashcard_id in flashcard_ids
+    ]).apply_async()
+    
+    logger.info(f"Queued embedding recalculation for {len(result.results)} flashcards in story {story_id}")
+    return {
+        'success': True,
+        'group_id': result.id,
+        'count': len(result.results)
+    }
+
+
+@shared_task(bind=True)
+def create_initial_story_task(self, story_id: int):
     """
     Celery task to create the first flashcard for a new story.
     
+    The segment is written on this (gevent) queue and embedded and stored by
+    save_story_segment_task on the 'embed' queue.
+    
     Args:
         story_id: ID of the newly created story
     """
+    try:
+        initial_prompt = Story.objects.values_list('initial_prompt', flat=True).get(id=story_id)
+        
+    except Exception as e:
+        logger.error(f"Error creating initial story for story {story_id}: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    
+    # Generate the first story segment based on the initial prompt
+    return self.replace(
+        write_story_segment_task.s("", initial_prompt)
+        | save_story_segment_task.s(story_id)
+    )
+
+
+@shared_task
+def import_story_segments_task(story_id: int, texts: list):
+    """
+    Celery task to add several existing story segments to a story at once.
+    
+    Args:
+        story_id: ID of the story
+        texts: Content of the segments to import, in story order
+    """
     try:
         story = Story.objects.get(id=story_id)
         
-        # Generate the first story segment based on the initial prompt
-        generated_text = generate_story_segment("", story.initial_prompt)
+        cards = create_flashcards(story.id, texts)
+        index_story_if_large(story.id, added=len(cards))
         
-        # Create the first flashcard
-        first_card = FlashCard.objects.create(
-            story=story,
-            content_text=generated_text,
-            embedding=generate_embedding(generated_text)
-        )
+        logger.info(f"Successfully imported {len(cards)} story segments for story {story_id}")
+        return {
+            'success': True,
+            'card_ids': [card.id for card in cards]
+        }
         
-        logger.info(f"Successfully created initial story segment for story {story_id}")
+    except Exception as e:
+        logger.error(f"Error importing story segments for story {story_id}: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=300)
+def build_story_ann_index_task(self, story_id: int):
+    """
+    Celery task to build the partial HNSW index of a large story.
+    
+    Retried on failure: it is only queued when the story crosses
+    ``settings.STORY_ANN_INDEX_THRESHOLD``, so a lost build would not be
+    queued again.
+    
+    Args:
+        story_id: ID of the story
+    """
+    try:
+        create_story_ann_index(story_id)
+        
+        logger.info(f"Successfully built ANN index for story {story_id}")
         return {
             'success': True,
-            'card_id': first_card.id,
-            'generated_text': generated_text
+            'story_id': story_id
         }
         
     except Exception as e:
-        logger.error(f"Error creating initial story for story {story_id}: {e}")
+        logger.error(f"Error building ANN index for story {story_id}: {e}")
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e)
         return {
             'success': False,
             'error': str(e)
-        } 
\ No newline at end of file
+        }
+
+
+@shared_task
+def drop_story_ann_index_task(story_id: int):
+    """
+    Celery task to drop the partial HNSW index of a deleted story.
+    
+    Args:
+        story_id: ID of the story
+    """
+    try:
+        drop_story_ann_index(story_id)
+        
+        logger.info(f"Successfully dropped ANN index for story {story_id}")
+        return {
+            'success': True,
+            'story_id': story_id
+        }
+        
+    except Exception as e:
+        logger.error(f"Error dropping ANN index for story {story_id}: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
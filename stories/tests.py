@@ -1,9 +1,24 @@
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+import threading
+import time
+from unittest import mock
+import numpy as np
+from django.contrib.postgres.search import SearchQuery
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
 from .models import Story, FlashCard, CardConnection
-from .utils import generate_embedding, perform_rag_search
+from .tasks import generate_story_segment_task
+from .utils import (
+    _EmbeddingBatcher, generate_embedding, generate_embeddings, perform_rag_search,
+    create_flashcards, rerank
+)
 
 User = get_user_model()
 
@@ -49,11 +64,73 @@ class FlashCardModelTest(TestCase):
         """Test creating a flashcard."""
         flashcard = FlashCard.objects.create(
             story=self.story,
-            content_text='This is a test flashcard content.'
+            content_text='This is a test flashcard content.',
+            embedding=generate_embedding('This is a test flashcard content.')
         )
         self.assertEqual(flashcard.story, self.story)
         self.assertEqual(flashcard.content_text, 'This is a test flashcard content.')
         self.assertIsNotNone(flashcard.embedding)
+    
+    def test_flashcard_full_text_search(self):
+        """Test saving a flashcard keeps its search vector in sync."""
+        flashcard = FlashCard.objects.create(
+            story=self.story,
+            content_text='The dragons slept beneath the mountain.',
+            embedding=generate_embedding('The dragons slept beneath the mountain.')
+        )
+        
+        self.assertQuerysetEqual(
+            FlashCard.objects.filter(search_vector=SearchQuery('dragon')),
+            [flashcard]
+        )
+        
+        flashcard.content_text = 'A ship sailed across the sea.'
+        flashcard.save(update_fields=['content_text'])
+        
+        self.assertFalse(FlashCard.objects.filter(search_vector=SearchQuery('dragon')).exists())
+
+
+class CardConnectionModelTest(TestCase):
+    """Test cases for CardConnection validation."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.story = Story.objects.create(owner=self.user, title='Test Story', initial_prompt='Once upon a time...')
+        self.other_story = Story.objects.create(owner=self.user, title='Other Story', initial_prompt='Far away...')
+        self.first, self.second = create_flashcards(self.story.id, ['First segment.', 'Second segment.'])
+        self.other_card, = create_flashcards(self.other_story.id, ['Elsewhere.'])
+    
+    def test_same_story_connection_is_valid(self):
+        """Test cards of the connection's own story can be connected."""
+        CardConnection(story=self.story, source_card=self.first, target_card=self.second).full_clean()
+    
+    def test_cross_story_connection_is_rejected(self):
+        """Test cards from another story cannot be connected."""
+        connections = [
+            CardConnection(story=self.story, source_card=self.first, target_card=self.other_card),
+            # Both cards agree with each other but not with the connection's story
+            CardConnection(story=self.other_story, source_card=self.first, target_card=self.second),
+        ]
+        for connection in connections:
+            with self.subTest(connection=connection), self.assertRaises(ValidationError) as ctx:
+                connection.full_clean()
+            self.assertIn('Source and target cards must belong to the same story', ctx.exception.messages)
+    
+    def test_self_loop_is_rejected(self):
+        """Test a card cannot be connected to itself."""
+        with self.assertRaises(ValidationError) as ctx:
+            CardConnection(story=self.story, source_card=self.first, target_card=self.first).full_clean()
+        self.assertIn('A card cannot connect to itself', ctx.exception.messages)
+    
+    def test_missing_card_is_rejected(self):
+        """Test a connection without a target card fails field validation."""
+        with self.assertRaises(ValidationError) as ctx:
+            CardConnection(story=self.story, source_card=self.first).full_clean()
+        self.assertIn('target_card', ctx.exception.message_dict)
 
 
 class StoryAPITest(APITestCase):
@@ -94,6 +171,67 @@ class StoryAPITest(APITestCase):
         response = self.client.get('/api/stories/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 2)
+    
+    def test_story_graph(self):
+        """Test the story graph returns nodes and edges."""
+        story = Story.objects.create(
+            owner=self.user,
+            title='Graph Story',
+            initial_prompt='Once upon a time...'
+        )
+        first, second = create_flashcards(story.id, ['First segment.', 'Second segment.'])
+        CardConnection.objects.create(story=story, source_card=first, target_card=second)
+        
+        response = self.client.get(f'/api/stories/{story.id}/graph/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        graph = response.json()
+        self.assertCountEqual([node['id'] for node in graph['nodes']], [first.id, second.id])
+        self.assertEqual(
+            [(edge['source'], edge['target']) for edge in graph['edges']],
+            [(first.id, second.id)]
+        )
+    
+    def test_story_graph_timestamps(self):
+        """Test graph timestamps are formatted like datetime.isoformat() in UTC."""
+        story = Story.objects.create(owner=self.user, title='Graph Story', initial_prompt='Once upon a time...')
+        first, second = create_flashcards(story.id, ['First segment.', 'Second segment.'])
+        # isoformat() drops the fraction entirely when microseconds are zero
+        FlashCard.objects.filter(pk=second.pk).update(
+            created_at=datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc)
+        )
+        FlashCard.objects.filter(pk=first.pk).update(
+            created_at=datetime(2024, 1, 2, 3, 4, 5, 123450, tzinfo=dt_timezone.utc)
+        )
+        card_connection = CardConnection.objects.create(story=story, source_card=first, target_card=second)
+        
+        with connection.cursor() as cursor:
+            cursor.execute("SET TIME ZONE 'Asia/Kolkata'")
+        try:
+            graph = self.client.get(f'/api/stories/{story.id}/graph/').json()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TIME ZONE 'UTC'")
+        
+        nodes = {node['id']: node['created_at'] for node in graph['nodes']}
+        for card in (first, second):
+            card.refresh_from_db()
+            self.assertEqual(nodes[card.id], card.created_at.isoformat())
+        self.assertEqual(nodes[first.id], '2024-01-02T03:04:05.123450+00:00')
+        self.assertEqual(nodes[second.id], '2024-01-02T03:04:05+00:00')
+        self.assertEqual(graph['edges'][0]['created_at'], card_connection.created_at.isoformat())
+    
+    def test_story_graph_of_other_user(self):
+        """Test the story graph is not visible to other users."""
+        other = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='testpass123'
+        )
+        story = Story.objects.create(owner=other, title='Private', initial_prompt='Secret')
+        
+        response = self.client.get(f'/api/stories/{story.id}/graph/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
 class UtilityFunctionTest(TestCase):
@@ -104,9 +242,70 @@ class UtilityFunctionTest(TestCase):
         text = "This is a test text for embedding generation."
         embedding = generate_embedding(text)
         
-        self.assertIsInstance(embedding, list)
-        self.assertEqual(len(embedding), 384)  # all-MiniLM-L6-v2 dimension
-        self.assertTrue(all(isinstance(x, (int, float)) for x in embedding))
+        self.assertIsInstance(embedding, np.ndarray)
+        self.assertEqual(embedding.dtype, np.float32)
+        self.assertEqual(embedding.shape, (384,))  # all-MiniLM-L6-v2 dimension
+    
+    def test_generate_embedding_is_normalized(self):
+        """Test embeddings are unit length so inner product equals cosine."""
+        embedding = generate_embedding("A dragon guarding a mountain of gold.")
+        norm = np.linalg.norm(embedding)
+        
+        self.assertAlmostEqual(norm, 1.0, places=4)
+    
+    def test_generate_embeddings_batch(self):
+        """Test batched embedding generation matches single-text encoding."""
+        texts = ["A brave knight.", "A magical forest.", "A sleeping dragon."]
+        embeddings = generate_embeddings(texts)
+        
+        self.assertEqual(embeddings.shape, (3, 384))
+        np.testing.assert_allclose(generate_embedding(texts[1]), embeddings[1], atol=1e-4)
+    
+    def test_concurrent_embeddings_share_one_encode(self):
+        """Test calls made while the model is busy are encoded in one batch."""
+        calls = []
+        first_call_started = threading.Event()
+        release_first_call = threading.Event()
+        
+        class BlockingModel:
+            def encode(self, texts, **kwargs):
+                calls.append(list(texts))
+                if len(calls) == 1:
+                    first_call_started.set()
+                    release_first_call.wait(5)
+                return np.eye(len(texts), 384, dtype=np.float32)
+        
+        model = BlockingModel()
+        batcher = _EmbeddingBatcher(lambda: model)
+        with mock.patch('stories.utils.get_embedding_model', return_value=model), \
+                mock.patch('stories.utils.embedding_batcher', batcher):
+            first = threading.Thread(target=generate_embedding, args=['busy'])
+            first.start()
+            first_call_started.wait(5)
+            
+            concurrent = [threading.Thread(target=generate_embedding, args=[text]) for text in ['a', 'b']]
+            for thread in concurrent:
+                thread.start()
+            while len(batcher._pending) < 2:
+                time.sleep(0.001)
+            release_first_call.set()
+            
+            for thread in [first, *concurrent]:
+                thread.join(5)
+        
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0], ['busy'])
+        self.assertCountEqual(calls[1], ['a', 'b'])
+    
+    def test_rerank(self):
+        """Test reranking scores cards by inner product with the query."""
+        texts = ['A brave knight rides into battle.', 'A quiet library at night.']
+        cards = [FlashCard(content_text=text, embedding=generate_embedding(text)) for text in texts]
+        
+        scores = rerank(generate_embedding('knight battle'), cards)
+        
+        self.assertEqual(scores.shape, (2,))
+        self.assertGreater(scores[0], scores[1])
     
     def test_perform_rag_search(self):
         """Test RAG search functionality."""
@@ -122,17 +321,151 @@ class UtilityFunctionTest(TestCase):
         )
         
         # Create some test flashcards
-        FlashCard.objects.create(
-            story=story,
-            content_text='First story segment about a brave knight.'
-        )
-        FlashCard.objects.create(
-            story=story,
-            content_text='Second story segment about a magical forest.'
-        )
+        for text in [
+            'First story segment about a brave knight.',
+            'Second story segment about a magical forest.'
+        ]:
+            FlashCard.objects.create(
+                story=story,
+                content_text=text,
+                embedding=generate_embedding(text)
+            )
         
         query_embedding = generate_embedding('knight adventure')
         results = perform_rag_search(story.id, query_embedding, top_k=2)
         
         self.assertIsInstance(results, list)
-        self.assertLessEqual(len(results), 2) 
\ No newline at end of file
+        self.assertLessEqual(len(results), 2) 
+    
+    def test_create_flashcards(self):
+        """Test bulk flashcard creation with batched embeddings."""
+        user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        story = Story.objects.create(
+            owner=user,
+            title='Test Story',
+            initial_prompt='Once upon a time...'
+        )
+        
+        cards = create_flashcards(story.id, ['First segment.', 'Second segment.'])
+        
+        self.assertEqual(len(cards), 2)
+        self.assertTrue(all(card.id for card in cards))
+        self.assertCountEqual(
+            story.flashcards.values_list('content_text', flat=True),
+            ['First segment.', 'Second segment.']
+        )
+
+
+class StoryTaskTest(TestCase):
+    """Test cases for story generation tasks."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.story = Story.objects.create(
+            owner=self.user,
+            title='Test Story',
+            initial_prompt='Once upon a time...'
+        )
+    
+    def test_generate_story_segment_embeds_generated_text_once(self):
+        """Test the new card is stored with its own text embedding in one write."""
+        with mock.patch('stories.tasks.generate_embedding', wraps=generate_embedding) as embed:
+            result = generate_story_segment_task.apply((self.story.id, 'The knight wakes up.')).get()
+        
+        self.assertTrue(result['success'])
+        self.assertEqual(
+            [call.args[0] for call in embed.call_args_list],
+            ['The knight wakes up.', result['generated_text']]
+        )
+        
+        card = FlashCard.objects.get(id=result['card_id'])
+        np.testing.assert_allclose(
+            card.embedding.to_numpy().astype(np.float32),
+            generate_embedding(result['generated_text']),
+            atol=1e-3
+        )
+    
+    def test_recalculate_embeddings_command(self):
+        """Test the upgrade command queues a recalculation for every story."""
+        other = Story.objects.create(owner=self.user, title='Other', initial_prompt='Elsewhere...')
+        
+        with mock.patch('stories.management.commands.recalculate_embeddings'
+                        '.recalculate_story_embeddings_task.delay') as delay:
+            call_command('recalculate_embeddings', stdout=StringIO())
+        
+        self.assertCountEqual([call.args[0] for call in delay.call_args_list], [self.story.id, other.id])
+
+
+class StoryAdminTest(TestCase):
+    """Test cases for the stories admin."""
+    
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123'
+        )
+        self.client.force_login(self.admin)
+        self.add_story()
+    
+    def add_story(self):
+        owner = User.objects.create_user(
+            username=f'owner{Story.objects.count()}',
+            email=f'owner{Story.objects.count()}@example.com',
+            password='testpass123'
+        )
+        story = Story.objects.create(owner=owner, title='Test Story', initial_prompt='Once upon a time...')
+        first, second = create_flashcards(story.id, ['First segment.', 'Second segment.'])
+        CardConnection.objects.create(story=story, source_card=first, target_card=second)
+        return story
+    
+    def test_backfill_search_vectors_command(self):
+        """Test the backfill command fills rows saved without a search_vector."""
+        Story.objects.update(search_vector=None)
+        FlashCard.objects.update(search_vector=None)
+        
+        call_command('backfill_search_vectors', batch_size=1, stdout=StringIO())
+        
+        self.assertFalse(Story.objects.filter(search_vector__isnull=True).exists())
+        self.assertFalse(FlashCard.objects.filter(search_vector__isnull=True).exists())
+        self.assertTrue(FlashCard.objects.filter(
+            search_vector=SearchQuery('segment', search_type='websearch')
+        ).exists())
+    
+    def test_changelist_queries_do_not_grow_with_stories(self):
+        """Test changelist query counts do not depend on the number of stories."""
+        for url in ['/admin/stories/flashcard/', '/admin/stories/cardconnection/']:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as baseline:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                
+                self.add_story()
+                self.add_story()
+                
+                with self.assertNumQueries(len(baseline)):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+    
+    def test_flashcard_change_view_loads_full_row(self):
+        """Test the preview-only columns are limited to the flashcard changelist."""
+        card = FlashCard.objects.first()
+        card.content_text = 'A long segment. ' * 20
+        card.save()
+        
+        response = self.client.get('/admin/stories/flashcard/')
+        self.assertContains(response, card.content_text[:100] + '...')
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/stories/flashcard/{card.id}/change/')
+        self.assertContains(response, card.content_text.strip())
+        # A deferred column would be fetched in a second query
+        self.assertEqual(
+            len([q for q in queries if 'FROM "stories_flashcard"' in q['sql']]), 1
+        )
@@ -1,38 +1,238 @@
+import collections
+import functools
 import os
+import threading
+from concurrent.futures import Future
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+import torch
 from sentence_transformers import SentenceTransformer
 from typing import List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize the sentence transformer model
-try:
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-except Exception as e:
-    logger.warning(f"Could not load embedding model: {e}")
-    embedding_model = None
 
+class _OnnxEmbeddingModel:
+    """
+    all-MiniLM-L6-v2 exported to ONNX and dynamically quantized to int8.
+    
+    Runs on onnxruntime's CPU provider and reproduces the sentence-transformers
+    pipeline (mean pooling + L2 normalization) in numpy. The exported model is
+    cached under ``settings.EMBEDDING_ONNX_DIR``.
+    
+    Requires the optional ``optimum[onnxruntime]`` package.
+    """
+    model_name = 'sentence-transformers/all-MiniLM-L6-v2'
+    max_seq_length = 256
+    
+    def __init__(self, cache_dir: str):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+        
+        if not os.path.exists(os.path.join(cache_dir, 'model_quantized.onnx')):
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                self.model_name, export=True, provider='CPUExecutionProvider'
+            )
+            quantizer = ORTQuantizer.from_pretrained(model)
+            quantizer.quantize(
+                save_dir=cache_dir,
+                quantization_config=AutoQuantizationConfig.avx2(is_static=False)
+            )
+            AutoTokenizer.from_pretrained(self.model_name).save_pretrained(cache_dir)
+        
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            cache_dir, file_name='model_quantized.onnx', provider='CPUExecutionProvider'
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(cache_dir)
+    
+    def encode(self, texts: List[str], batch_size: int = 32,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """Mirror of ``SentenceTransformer.encode`` returning a numpy matrix."""
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            token_embeddings = self.model(**inputs).last_hidden_state
+            
+            # Mean pooling over the non-padding tokens
+            mask = inputs['attention_mask'][..., np.newaxis].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            batches.append(summed / np.clip(mask.sum(axis=1), 1e-9, None))
+        
+        embeddings = np.concatenate(batches).astype(np.float32)
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
 
-def generate_embedding(text: str) -> List[float]:
+
+@functools.lru_cache(maxsize=1)
+def get_embedding_model():
     """
-    Generate embedding for given text using sentence-transformers.
+    Load the embedding model once per process.
+    
+    Uses the ONNX Runtime backend when ``settings.EMBEDDING_BACKEND`` is
+    ``'onnx'``, falling back to the sentence-transformers PyTorch model if
+    it cannot be loaded.
+    
+    Celery workers call this before forking their pool (see storyscape/celery.py)
+    so prefork children share the weights copy-on-write instead of each
+    loading their own copy.
+    
+    Returns:
+        The model in inference mode, or None if it could not be loaded
+    """
+    if settings.EMBEDDING_BACKEND == 'onnx':
+        try:
+            return _OnnxEmbeddingModel(settings.EMBEDDING_ONNX_DIR)
+        except Exception as e:
+            logger.warning(f"Could not load ONNX embedding model, falling back to PyTorch: {e}")
+    
+    try:
+        model = SentenceTransformer('all-MiniLM-L6-v2')
+    except Exception as e:
+        logger.warning(f"Could not load embedding model: {e}")
+        return None
+    
+    model.eval()
+    if model.device.type == 'cuda':
+        # FP16 halves the encode cost on GPU; embeddings are stored as FP16 anyway
+        model.half()
+    return model
+
+
+class _EmbeddingBatcher:
+    """
+    Micro-batches concurrent encode requests into a single model forward pass.
+    
+    A caller that finds the model idle encodes its texts straight away in its
+    own thread. Texts submitted while a forward pass is running are queued,
+    and that caller encodes them together (up to ``max_batch`` texts) once it
+    finishes, so batching never makes a request wait for companions.
+    """
+    
+    def __init__(self, get_model, max_batch: int = 32):
+        self.get_model = get_model
+        self.max_batch = max_batch
+        self._reset()
+    
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._busy = False
+        self._pid = os.getpid()
+    
+    def encode(self, texts: List[str]):
+        """Encode texts and return a numpy matrix of normalized embeddings."""
+        if self._pid != os.getpid():
+            # A fork (e.g. Celery prefork children) may have copied the state
+            # of a forward pass that only exists in the parent
+            self._reset()
+        
+        future = Future()
+        with self._lock:
+            self._pending.append((texts, future))
+            lead = not self._busy
+            self._busy = True
+        
+        if lead:
+            self._drain()
+        return future.result()
+    
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._busy = False
+                    return
+                batch = [self._pending.popleft()]
+                size = len(batch[0][0])
+                while self._pending and size + len(self._pending[0][0]) <= self.max_batch:
+                    item = self._pending.popleft()
+                    batch.append(item)
+                    size += len(item[0])
+            self._encode_batch(batch)
+    
+    def _encode_batch(self, batch):
+        texts = [text for item_texts, _ in batch for text in item_texts]
+        try:
+            # Normalized vectors let the search use inner product instead of cosine
+            with torch.inference_mode():
+                embeddings = self.get_model().encode(
+                    texts,
+                    batch_size=self.max_batch,
+                    normalize_embeddings=True,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        offset = 0
+        for item_texts, future in batch:
+            future.set_result(embeddings[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+
+
+embedding_batcher = _EmbeddingBatcher(get_embedding_model)
+
+# Shared read-only fallback returned when no embedding can be computed
+_ZERO_EMBEDDING = np.zeros(384, dtype=np.float32)
+_ZERO_EMBEDDING.flags.writeable = False
+
+
+def _zero_embeddings(count: int) -> np.ndarray:
+    return np.broadcast_to(_ZERO_EMBEDDING, (count, _ZERO_EMBEDDING.shape[0]))
+
+
+def generate_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Generate embeddings for several texts in a single model batch.
     
     Args:
-        text: The text to generate embedding for
+        texts: The texts to generate embeddings for
         
     Returns:
-        List of floats representing the embedding vector
+        float32 array of shape (len(texts), 384) with one L2-normalized
+        embedding per row
     """
-    if not embedding_model:
-        # Return a dummy embedding if model is not available
-        return [0.0] * 384
+    if not get_embedding_model():
+        # Return dummy embeddings if model is not available
+        return _zero_embeddings(len(texts))
+    
+    if not texts:
+        return _zero_embeddings(0)
     
     try:
-        embedding = embedding_model.encode(text)
-        return embedding.tolist()
+        return np.asarray(embedding_batcher.encode(list(texts)), dtype=np.float32)
     except Exception as e:
-        logger.error(f"Error generating embedding: {e}")
-        return [0.0] * 384
+        logger.error(f"Error generating embeddings: {e}")
+        return _zero_embeddings(len(texts))
+
+
+def generate_embedding(text: str) -> np.ndarray:
+    """
+    Generate embedding for given text using sentence-transformers.
+    
+    Concurrent calls are batched together into one model forward pass.
+    
+    Args:
+        text: The text to generate embedding for
+        
+    Returns:
+        float32 array holding the L2-normalized embedding vector. The array
+        may be read-only; copy it before modifying it in place.
+    """
+    return generate_embeddings([text])[0]
 
 
 def generate_story_segment(context: str, user_prompt: str) -> str:
@@ -116,30 +316,156 @@ def generate_image(prompt: str, style: Optional[str] = None) -> str:
     return f"https://placeholder.com/image?text={prompt.replace(' ', '+')}"
 
 
-def perform_rag_search(story_id: int, query_embedding: List[float], top_k: int = 5) -> List[str]:
+def perform_rag_search(story_id: int, query_embedding: np.ndarray, top_k: int = 5) -> List[str]:
     """
     Perform RAG search to find relevant story segments.
     
     Args:
         story_id: ID of the story to search within
-        query_embedding: Embedding of the user's query
+        query_embedding: L2-normalized embedding of the user's query
         top_k: Number of top results to return
         
     Returns:
         List of relevant story segment texts
     """
     from .models import FlashCard
-    from pgvector.django import CosineDistance
+    from pgvector.django import HalfVector, MaxInnerProduct
     
     try:
-        # Search for similar flashcards within the same story
-        similar_cards = FlashCard.objects.filter(
-            story_id=story_id
-        ).order_by(
-            CosineDistance('embedding', query_embedding)
-        )[:top_k]
-        
-        return [card.content_text for card in similar_cards]
+        # SET LOCAL only lasts for the current transaction, so the query
+        # has to be evaluated inside the same atomic block
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET LOCAL hnsw.ef_search = %s",
+                    [int(settings.HNSW_EF_SEARCH)]
+                )
+            
+            # Search for similar flashcards within the same story
+            similar_cards = FlashCard.objects.filter(
+                story_id=story_id
+            ).order_by(
+                MaxInnerProduct('embedding', HalfVector(query_embedding))
+            ).values_list('content_text', flat=True)[:top_k]
+            
+            return list(similar_cards)
     except Exception as e:
         logger.error(f"Error in RAG search: {e}")
-        return [] 
\ No newline at end of file
+        return [] 
+
+
+def rerank(query_embedding: np.ndarray, cards) -> np.ndarray:
+    """
+    Score flashcards against a query embedding.
+    
+    The card embeddings are stacked into one float32 matrix so scoring is a
+    single BLAS matrix-vector product instead of a Python loop per card.
+    
+    Args:
+        query_embedding: L2-normalized embedding of the query
+        cards: FlashCards (or any objects with an ``embedding``) to score
+        
+    Returns:
+        Array of similarity scores aligned with ``cards``. Embeddings are
+        normalized, so the inner product equals cosine similarity.
+    """
+    from pgvector.django import HalfVector
+    
+    vectors = [
+        card.embedding.to_numpy() if isinstance(card.embedding, HalfVector) else card.embedding
+        for card in cards
+    ]
+    if not vectors:
+        return np.empty(0, dtype=np.float32)
+    
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix @ np.asarray(query_embedding, dtype=np.float32)
+
+
+def create_flashcards(story_id: int, texts: List[str], batch_size: int = 500) -> list:
+    """
+    Create flashcards for several story segments at once.
+    
+    All texts are encoded in one model batch and inserted with bulk INSERTs
+    instead of one encode and one INSERT per card.
+    
+    Args:
+        story_id: ID of the story the cards belong to
+        texts: Content of the new flashcards, in story order
+        batch_size: Maximum number of rows per INSERT statement
+        
+    Returns:
+        List of the created FlashCard instances
+    """
+    from .models import FlashCard
+    
+    embeddings = generate_embeddings(texts)
+    return FlashCard.objects.bulk_create(
+        [
+            FlashCard(
+                story_id=story_id,
+                content_text=text,
+                embedding=embedding,
+                # bulk_create bypasses save(), which normally fills this in
+                search_vector=FlashCard.build_search_vector(text)
+            )
+            for text, embedding in zip(texts, embeddings)
+        ],
+        batch_size=batch_size
+    )
+
+
+def story_ann_index_name(story_id: int) -> str:
+    """Name of the partial HNSW index covering a single story's flashcards."""
+    return f'fc_hnsw_story_{int(story_id)}'
+
+
+def create_story_ann_index(story_id: int) -> None:
+    """
+    Build a partial HNSW index over one story's flashcard embeddings.
+    
+    perform_rag_search always filters by story, so on a large table the global
+    index has to over-scan past other stories' cards to fill ``top_k``. A
+    partial index scoped to ``story_id`` lets the planner search only that
+    story's graph. Must run outside a transaction (CREATE INDEX CONCURRENTLY).
+    An invalid index left by an earlier failed build is dropped and rebuilt.
+    
+    Args:
+        story_id: ID of the story to index
+    """
+    from .models import FlashCard
+    
+    index_name = story_ann_index_name(story_id)
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        # A failed CONCURRENTLY build leaves an INVALID index behind, which
+        # IF NOT EXISTS would otherwise skip forever
+        cursor.execute(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+            [index_name]
+        )
+        row = cursor.fetchone()
+        if row is not None and not row[0]:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {quote_name(index_name)}")
+        
+        cursor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {quote_name(index_name)} "
+            f"ON {quote_name(FlashCard._meta.db_table)} "
+            f"USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64) "
+            f"WHERE story_id = {int(story_id)}"
+        )
+
+
+def drop_story_ann_index(story_id: int) -> None:
+    """
+    Drop the partial HNSW index of a story, if it has one.
+    
+    Args:
+        story_id: ID of the story
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DROP INDEX CONCURRENTLY IF EXISTS "
+            f"{connection.ops.quote_name(story_ann_index_name(story_id))}"
+        )
+
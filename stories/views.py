@@ -1,9 +1,12 @@
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from django.db import connection
+from django.db.models import Prefetch
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import PermissionDenied
-from .models import Story, FlashCard
+from .models import Story, FlashCard, CardConnection
 from .serializers import (
     StorySerializer, StoryCreateSerializer, FlashCardSerializer,
     FlashCardCreateSerializer, FlashCardUpdateSerializer, ImageGenerationSerializer
@@ -13,12 +16,24 @@ from .tasks import (
 )
 
 
+def get_story_queryset(user):
+    """
+    Stories owned by the user with everything StorySerializer renders
+    loaded up front. The embedding and search vector columns are deferred
+    since no API field exposes them.
+    """
+    return Story.objects.filter(owner=user).defer('search_vector').select_related('owner').prefetch_related(
+        Prefetch('flashcards', queryset=FlashCard.objects.defer('embedding', 'search_vector')),
+        Prefetch('connections', queryset=CardConnection.objects.only('id', 'story', 'created_at')),
+    )
+
+
 class StoryListView(generics.ListCreateAPIView):
     """API view for listing and creating stories."""
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Story.objects.filter(owner=self.request.user)
+        return get_story_queryset(self.request.user)
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -45,7 +60,7 @@ class StoryDetailView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Story.objects.filter(owner=self.request.user)
+        return get_story_queryset(self.request.user)
 
 
 class FlashCardCreateView(generics.CreateAPIView):
@@ -120,35 +135,62 @@ def generate_image_view(request, pk):
     }, status=status.HTTP_202_ACCEPTED)
 
 
+def _isoformat_sql(column):
+    """
+    SQL rendering a timestamptz column exactly like ``datetime.isoformat()``
+    on an aware UTC datetime, whatever the session TimeZone: six fractional
+    digits, none when the microseconds are zero, and a "+00:00" suffix.
+    """
+    utc = f"({column} AT TIME ZONE 'UTC')"
+    return (
+        f"to_char({utc}, 'YYYY-MM-DD\"T\"HH24:MI:SS') || "
+        f"CASE WHEN date_trunc('second', {column}) = {column} THEN '' ELSE to_char({utc}, '.US') END || "
+        f"'+00:00'"
+    )
+
+
+# Story graph payload assembled by Postgres; the result is sent to the
+# client verbatim, so keys and formats must match the API contract
+STORY_GRAPH_SQL = """
+    SELECT json_build_object(
+        'nodes', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', card.id,
+                'content', card.content_text,
+                'image_url', card.image_url,
+                'created_at', {card_created_at}
+            ) ORDER BY card.created_at)
+            FROM {flashcard_table} card
+            WHERE card.story_id = %(story_id)s
+        ), '[]'::json),
+        'edges', COALESCE((
+            SELECT json_agg(json_build_object(
+                'source', conn.source_card_id,
+                'target', conn.target_card_id,
+                'created_at', {conn_created_at}
+            ) ORDER BY conn.created_at)
+            FROM {connection_table} conn
+            WHERE conn.story_id = %(story_id)s
+        ), '[]'::json)
+    )::text
+""".format(
+    flashcard_table=connection.ops.quote_name(FlashCard._meta.db_table),
+    connection_table=connection.ops.quote_name(CardConnection._meta.db_table),
+    card_created_at=_isoformat_sql('card.created_at'),
+    conn_created_at=_isoformat_sql('conn.created_at'),
+)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def story_graph_view(request, pk):
     """API view for getting the story graph structure."""
-    story = get_object_or_404(Story.objects.filter(owner=request.user), pk=pk)
-    
-    # Get all flashcards and connections for the story
-    flashcards = story.flashcards.all()
-    connections = story.connections.all()
+    story = get_object_or_404(Story.objects.filter(owner=request.user).only('id'), pk=pk)
     
-    # Build graph structure
-    graph_data = {
-        'nodes': [
-            {
-                'id': card.id,
-                'content': card.content_text,
-                'image_url': card.image_url,
-                'created_at': card.created_at.isoformat()
-            }
-            for card in flashcards
-        ],
-        'edges': [
-            {
-                'source': conn.source_card.id,
-                'target': conn.target_card.id,
-                'created_at': conn.created_at.isoformat()
-            }
-            for conn in connections
-        ]
-    }
+    # Build the nodes and edges JSON in a single query instead of loading
+    # model instances and serializing them in Python
+    with connection.cursor() as cursor:
+        cursor.execute(STORY_GRAPH_SQL, {'story_id': story.id})
+        graph_json = cursor.fetchone()[0]
     
-    return Response(graph_data) 
\ No newline at end of file
+    return HttpResponse(graph_json, content_type='application/json')
@@ -1 +1,5 @@
- 
\ No newline at end of file
+# Load the Celery app whenever Django starts, so tasks sent from the web
+# process use its broker settings and CELERY_TASK_ROUTES
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -1,5 +1,28 @@
 import os
 from celery import Celery
+from celery.signals import worker_init
+
+
+def is_gevent_patched():
+    """Whether this process was monkey-patched by `celery worker -P gevent`."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def patch_psycopg_for_gevent():
+    # `celery worker -P gevent` monkey-patches the standard library before
+    # this module is imported, but psycopg2 is a C extension that waits on
+    # sockets itself. Without a wait callback every ORM query would block
+    # the whole gevent pool rather than just its own greenlet.
+    if is_gevent_patched():
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+patch_psycopg_for_gevent()
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'storyscape.settings')
@@ -14,6 +37,20 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_init.connect
+def preload_embedding_model(sender, **kwargs):
+    # Load the model in the main worker process before the pool forks,
+    # so child processes share its memory instead of loading their own copy.
+    # Only workers consuming the 'embed' queue encode (see CELERY_TASK_ROUTES);
+    # the gevent I/O worker would load the weights, or export the ONNX model,
+    # for nothing.
+    if is_gevent_patched() or 'embed' not in sender.app.amqp.queues.consume_from:
+        return
+    
+    from stories.utils import get_embedding_model
+    get_embedding_model()
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}') 
\ No newline at end of file
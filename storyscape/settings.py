@@ -1,6 +1,7 @@
 import os
 import environ
 from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
 
 # Initialize environ
 env = environ.Env()
@@ -25,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -69,6 +71,21 @@ DATABASES = {
     'default': env.db('DATABASE_URL')
 }
 
+# Cache
+# The cache lives in its own Redis database (REDIS_URL's server, database 1 by
+# default) so that clearing it never drops the Celery tasks queued in REDIS_URL
+REDIS_CACHE_URL = env(
+    'REDIS_CACHE_URL',
+    default=urlunsplit(urlsplit(env('REDIS_URL'))._replace(path='/1'))
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_CACHE_URL,
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -108,7 +125,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -133,5 +150,29 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# LLM and image tasks are I/O-bound and run on the default queue with a gevent
+# pool; anything that runs the embedding model is CPU-bound and would stall
+# every greenlet on that pool, so it goes to a separate prefork worker
+CELERY_TASK_ROUTES = {
+    'stories.tasks.generate_story_segment_task': {'queue': 'embed'},
+    'stories.tasks.save_story_segment_task': {'queue': 'embed'},
+    'stories.tasks.recalculate_embedding_task': {'queue': 'embed'},
+    'stories.tasks.import_story_segments_task': {'queue': 'embed'},
+    # Index builds take minutes and must not tie up the gevent pool
+    'stories.tasks.build_story_ann_index_task': {'queue': 'embed'},
+    'stories.tasks.drop_story_ann_index_task': {'queue': 'embed'},
+}
+
 # Vector embedding dimension
-VECTOR_DIMENSION = 384  # for all-MiniLM-L6-v2 model 
\ No newline at end of file
+VECTOR_DIMENSION = 384  # for all-MiniLM-L6-v2 model 
+
+# Embedding backend: 'torch' (sentence-transformers) or 'onnx' (int8 ONNX Runtime,
+# requires optimum[onnxruntime])
+EMBEDDING_BACKEND = env('EMBEDDING_BACKEND', default='torch')
+EMBEDDING_ONNX_DIR = env('EMBEDDING_ONNX_DIR', default=os.path.join(BASE_DIR, 'onnx_models'))
+
+# Size of the candidate list used by HNSW index scans (higher = better recall, slower)
+HNSW_EF_SEARCH = env.int('HNSW_EF_SEARCH', default=40)
+
+# Stories with at least this many flashcards get their own partial HNSW index
+STORY_ANN_INDEX_THRESHOLD = env.int('STORY_ANN_INDEX_THRESHOLD', default=1000)
@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from .utils import AUTH_CACHE_TIMEOUT, auth_cache_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the token and its user.
+    
+    Saves the token/user SELECT on every authenticated request. Cached entries
+    are dropped when the token is deleted or the user is saved (see
+    users/signals.py), and expire after AUTH_CACHE_TIMEOUT seconds otherwise.
+    The user is cached without its password hash, and changes made with
+    QuerySet.update() can show up to AUTH_CACHE_TIMEOUT seconds late, so views
+    that save the user must load it fresh. When the cache is unreachable
+    the token is read from the database as TokenAuthentication does.
+    """
+    
+    def authenticate_credentials(self, key):
+        cache_key = auth_cache_key(key)
+        try:
+            token = cache.get(cache_key)
+        except Exception as e:
+            logger.warning(f"Could not read cached token, loading it from the database: {e}")
+            token = cache_key = None
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').defer('user__password').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if cache_key is not None:
+                try:
+                    cache.set(cache_key, token, timeout=AUTH_CACHE_TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"Could not cache token: {e}")
+        
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        
+        return (token.user, token)
@@ -1,7 +1,16 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
 
+class CustomUserManager(UserManager):
+    """User manager that loads the auth token along with the user."""
+    
+    def get_by_natural_key(self, username):
+        # Used by ModelBackend.authenticate; login reads user.auth_token
+        # without a second query
+        return self.select_related('auth_token').get(**{self.model.USERNAME_FIELD: username})
+
+
 class CustomUser(AbstractUser):
     """
     Custom user model extending Django's AbstractUser.
@@ -10,6 +19,9 @@ class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     bio = models.TextField(max_length=500, blank=True)
     avatar = models.URLField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CustomUserManager()
     
     # Use email as the username field
     USERNAME_FIELD = 'email'
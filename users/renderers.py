@@ -0,0 +1,16 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson.
+    
+    Types orjson cannot encode natively (lazy translation strings, Decimal,
+    etc.) fall back to DRF's JSON encoder, so output matches JSONRenderer.
+    """
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=self.encoder_class().default)
@@ -53,4 +53,27 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['id', 'username', 'email', 'bio', 'avatar', 'date_joined']
-        read_only_fields = ['id', 'date_joined'] 
\ No newline at end of file
+        read_only_fields = ['id', 'date_joined'] 
+
+
+# Formats date_joined exactly like UserSerializer does
+_date_joined_field = serializers.DateTimeField()
+
+
+def serialize_user_fast(user) -> dict:
+    """
+    Plain-dict equivalent of ``UserSerializer(user).data``.
+    
+    Used on the register/login hot path, where building a serializer (field
+    deep copies, BindingDict, attribute lookups) costs more than the data.
+    Must be kept in sync with ``UserSerializer.Meta.fields``.
+    """
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'bio': user.bio,
+        'avatar': user.avatar,
+        'date_joined': _date_joined_field.to_representation(user.date_joined),
+    }
+
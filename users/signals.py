@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .models import CustomUser
+from .utils import auth_cache_key, token_cache_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """Drop the cached token key when a token is created, changed or deleted."""
+    try:
+        cache.delete_many([token_cache_key(instance.user_id), auth_cache_key(instance.key)])
+    except Exception as e:
+        logger.warning(f"Could not invalidate the cached token of user {instance.user_id}: {e}")
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_cached_auth_user(sender, instance, created, **kwargs):
+    """Drop the user cached by CachedTokenAuthentication when the user changes."""
+    if created:
+        return
+    keys = set(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+    try:
+        # A key issued at registration may not be stored yet (see issue_token_deferred)
+        pending_key = cache.get(token_cache_key(instance.pk))
+        if pending_key is not None:
+            keys.add(pending_key)
+        cache.delete_many([auth_cache_key(key) for key in keys])
+    except Exception as e:
+        logger.warning(f"Could not invalidate the cached tokens of user {instance.pk}: {e}")
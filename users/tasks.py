@@ -0,0 +1,33 @@
+from celery import shared_task
+from rest_framework.authtoken.models import Token
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=2)
+def persist_token_task(self, user_id: int, key: str):
+    """
+    Celery task to store the auth token issued at registration.
+    
+    Idempotent: if the user already has a token (a duplicated delivery, or a
+    login that created one first), that token is kept.
+    
+    Args:
+        user_id: ID of the user
+        key: Token key returned to the client
+    """
+    try:
+        token, created = Token.objects.get_or_create(user_id=user_id, defaults={'key': key})
+        
+        logger.info(f"Persisted auth token for user {user_id} (created={created})")
+        return {
+            'success': True,
+            'user_id': user_id,
+            'created': created
+        }
+        
+    except Exception as e:
+        # The client already holds the key, so keep trying rather than drop it
+        logger.error(f"Error persisting auth token for user {user_id}: {e}")
+        raise self.retry(exc=e)
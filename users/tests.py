@@ -0,0 +1,279 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from .serializers import UserSerializer, serialize_user_fast
+from .tasks import persist_token_task
+from .utils import auth_cache_key
+
+User = get_user_model()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AuthAPITest(APITestCase):
+    """Test cases for registration and login endpoints."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='Str0ng-pass-123'
+        )
+    
+    def test_register(self):
+        """Test registering returns the new user and a token stored after commit."""
+        with mock.patch.object(persist_token_task, 'delay', side_effect=persist_token_task) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/auth/register/', {
+                    'username': 'newuser',
+                    'email': 'new@example.com',
+                    'password': 'Str0ng-pass-123',
+                    'password_confirm': 'Str0ng-pass-123'
+                })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        user = User.objects.get(email='new@example.com')
+        self.assertEqual(response.json()['user']['id'], user.id)
+        self.assertEqual(response.json()['token'], Token.objects.get(user=user).key)
+        delay.assert_called_once_with(user.id, response.json()['token'])
+    
+    def test_register_token_usable_before_persisted(self):
+        """Test the issued token works for login and authentication before it is stored."""
+        with mock.patch.object(persist_token_task, 'delay'):
+            response = self.client.post('/api/auth/register/', {
+                'username': 'newuser',
+                'email': 'new@example.com',
+                'password': 'Str0ng-pass-123',
+                'password_confirm': 'Str0ng-pass-123'
+            })
+        key = response.json()['token']
+        self.assertFalse(Token.objects.filter(key=key).exists())
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_200_OK)
+        
+        self.assertNotIn('password', cache.get(auth_cache_key(key)).user.__dict__)
+        
+        # Logging in stores the pending key, so it survives a lost task
+        login = self.client.post('/api/auth/token/', {
+            'email': 'new@example.com', 'password': 'Str0ng-pass-123'
+        })
+        self.assertEqual(login.json()['token'], key)
+        self.assertTrue(Token.objects.filter(key=key, user__email='new@example.com').exists())
+    
+    def test_register_stores_token_when_queueing_fails(self):
+        """Test the token is stored in the request when the task cannot be queued."""
+        with mock.patch.object(persist_token_task, 'delay', side_effect=OSError('broker down')):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/auth/register/', {
+                    'username': 'newuser',
+                    'email': 'new@example.com',
+                    'password': 'Str0ng-pass-123',
+                    'password_confirm': 'Str0ng-pass-123'
+                })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Token.objects.filter(
+            key=response.json()['token'], user__email='new@example.com'
+        ).exists())
+    
+    def test_pending_token_invalidated_on_user_save(self):
+        """Test deactivating a user drops their not yet stored token from the cache."""
+        with mock.patch.object(persist_token_task, 'delay'):
+            key = self.client.post('/api/auth/register/', {
+                'username': 'newuser',
+                'email': 'new@example.com',
+                'password': 'Str0ng-pass-123',
+                'password_confirm': 'Str0ng-pass-123'
+            }).json()['token']
+        
+        user = User.objects.get(email='new@example.com')
+        user.is_active = False
+        user.save()
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_login(self):
+        """Test logging in returns the same token on every call."""
+        credentials = {'email': 'test@example.com', 'password': 'Str0ng-pass-123'}
+        
+        first = self.client.post('/api/auth/token/', credentials)
+        second = self.client.post('/api/auth/token/', credentials)
+        
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.json()['token'], Token.objects.get(user=self.user).key)
+        self.assertEqual(second.json()['token'], first.json()['token'])
+    
+    def test_login_single_query(self):
+        """Test logging in with an existing token takes a single query."""
+        token = Token.objects.create(user=self.user)
+        credentials = {'email': 'test@example.com', 'password': 'Str0ng-pass-123'}
+        
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/auth/token/', credentials)
+        self.assertEqual(response.json()['token'], token.key)
+    
+    def test_login_after_token_deleted(self):
+        """Test a deleted token is not served from the cache."""
+        credentials = {'email': 'test@example.com', 'password': 'Str0ng-pass-123'}
+        old_key = self.client.post('/api/auth/token/', credentials).json()['token']
+        
+        Token.objects.filter(key=old_key).delete()
+        
+        new_key = self.client.post('/api/auth/token/', credentials).json()['token']
+        self.assertNotEqual(new_key, old_key)
+        self.assertTrue(Token.objects.filter(key=new_key, user=self.user).exists())
+    
+    def test_login_invalid_credentials(self):
+        """Test logging in with a wrong password is rejected."""
+        response = self.client.post('/api/auth/token/', {
+            'email': 'test@example.com',
+            'password': 'wrong-password'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_serialize_user_fast_matches_serializer(self):
+        """Test the fast user serializer matches UserSerializer output."""
+        self.assertEqual(serialize_user_fast(self.user), UserSerializer(self.user).data)
+    
+    def test_profile_not_modified(self):
+        """Test an unchanged profile is answered with 304 for a matching ETag."""
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        
+        first = self.client.get('/api/auth/profile/')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        
+        second = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        self.client.patch('/api/auth/profile/', {'bio': 'Updated'})
+        third = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+        self.assertEqual(third.json()['bio'], 'Updated')
+    
+    def test_cached_authentication_invalidated(self):
+        """Test deactivated users and deleted tokens are not served from the cache."""
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_200_OK)
+        
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        self.user.is_active = True
+        self.user.save()
+        token.delete()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_bulk_register(self):
+        """Test an admin can register several users with tokens at once."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='Str0ng-pass-123'
+        )
+        self.client.force_authenticate(user=admin)
+        payload = [
+            {
+                'username': f'bulk{i}',
+                'email': f'Bulk{i}@EXAMPLE.com',
+                'password': 'Str0ng-pass-123',
+                'password_confirm': 'Str0ng-pass-123'
+            }
+            for i in range(3)
+        ]
+        
+        response = self.client.post('/api/auth/register/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        for i, entry in enumerate(response.json()):
+            user = User.objects.get(pk=entry['user']['id'])
+            self.assertEqual(user.email, f'Bulk{i}@example.com')
+            self.assertTrue(user.check_password('Str0ng-pass-123'))
+            self.assertEqual(entry['token'], Token.objects.get(user=user).key)
+        
+        duplicate = self.client.post('/api/auth/register/bulk/', [
+            {**payload[0], 'username': 'dup', 'email': 'dup@example.com'},
+            {**payload[0], 'username': 'dup', 'email': 'dup2@example.com'},
+        ], format='json')
+        self.assertEqual(duplicate.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(User.objects.filter(username='dup').exists())
+        
+        self.client.force_authenticate(user=self.user)
+        forbidden = self.client.post('/api/auth/register/bulk/', payload, format='json')
+        self.assertEqual(forbidden.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_register_invalid(self):
+        """Test registration errors are reported per field."""
+        response = self.client.post('/api/auth/register/', {
+            'username': 'testuser',
+            'email': 'other@example.com',
+            'password': 'Str0ng-pass-123',
+            'password_confirm': 'different'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('username', response.json())
+    
+    def test_cached_authentication_excludes_password(self):
+        """Test the cached user carries no password hash."""
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.client.get('/api/auth/profile/')
+        
+        cached = cache.get(auth_cache_key(token.key))
+        self.assertIn('password', cached.user.get_deferred_fields())
+    
+    def test_profile_update_uses_current_row(self):
+        """Test a profile update does not write back a stale cached user."""
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.client.get('/api/auth/profile/')
+        
+        User.objects.filter(pk=self.user.pk).update(first_name='Set by admin')
+        response = self.client.patch('/api/auth/profile/', {'bio': 'Updated'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Set by admin')
+        self.assertEqual(self.user.bio, 'Updated')
+
+
+# Nothing listens on port 1, so every cache call raises a ConnectionError
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    'LOCATION': 'redis://127.0.0.1:1/0',
+}})
+class CacheUnavailableAuthTest(APITestCase):
+    """Test cases for authentication while the cache is down."""
+    
+    def test_register_login_and_authenticate(self):
+        """Test tokens are stored and checked in the database when caching fails."""
+        with mock.patch.object(persist_token_task, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/auth/register/', {
+                    'username': 'newuser',
+                    'email': 'new@example.com',
+                    'password': 'Str0ng-pass-123',
+                    'password_confirm': 'Str0ng-pass-123'
+                })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        key = response.json()['token']
+        self.assertTrue(Token.objects.filter(key=key, user__email='new@example.com').exists())
+        delay.assert_not_called()
+        
+        login = self.client.post('/api/auth/token/', {
+            'email': 'new@example.com', 'password': 'Str0ng-pass-123'
+        })
+        self.assertEqual(login.json()['token'], key)
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_200_OK)
+        
+        user = User.objects.get(email='new@example.com')
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import RegisterView, login_view, UserProfileView
+from .views import RegisterView, BulkRegisterView, LoginView, UserProfileView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
-    path('token/', login_view, name='login'),
+    path('register/bulk/', BulkRegisterView.as_view(), name='register-bulk'),
+    path('token/', LoginView.as_view(), name='login'),
     path('profile/', UserProfileView.as_view(), name='profile'),
 ] 
\ No newline at end of file
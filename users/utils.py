@@ -0,0 +1,118 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from .tasks import persist_token_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long a user's token key stays cached, in seconds
+TOKEN_CACHE_TIMEOUT = 3600
+
+# How long an authenticated token and its user stay cached, in seconds
+AUTH_CACHE_TIMEOUT = 60
+
+
+def token_cache_key(user_id: int) -> str:
+    """Cache key holding the auth token key of a user."""
+    return f"authtoken:{user_id}"
+
+
+def auth_cache_key(key: str) -> str:
+    """Cache key holding the token, with its user, authenticated by a key."""
+    return f"authuser:{key}"
+
+
+def user_without_password(user):
+    """
+    Copy of a user with the password hash deferred, for storing in the cache.
+    
+    Reading ``password`` on the copy loads it from the database.
+    """
+    fields = [f.attname for f in user._meta.concrete_fields if f.attname != 'password']
+    return type(user).from_db(user._state.db, fields, [getattr(user, f) for f in fields])
+
+
+def issue_token_deferred(user) -> str:
+    """
+    Issue the auth token of a new user without writing it in the request.
+    
+    The key is generated here and returned right away; persist_token_task
+    stores it once the current transaction commits. Until then the key is
+    served from the caches read by login and CachedTokenAuthentication, which
+    are kept for the same TOKEN_CACHE_TIMEOUT. A login in that window stores
+    the key itself (see get_or_create_token_cached), so it stays valid even
+    if the task is late or fails. If the key cannot be cached it is stored
+    right away instead.
+    
+    Args:
+        user: The newly created user, who has no token yet
+        
+    Returns:
+        The token key
+    """
+    key = Token.generate_key()
+    try:
+        cache.set_many({
+            token_cache_key(user.pk): key,
+            auth_cache_key(key): Token(key=key, user=user_without_password(user)),
+        }, timeout=TOKEN_CACHE_TIMEOUT)
+    except Exception as e:
+        # Nothing would serve the key until the task runs, so store it now
+        logger.warning(f"Could not cache the token of user {user.pk}, storing it inline: {e}")
+        return _get_or_insert_token_key(user.pk, key)
+    transaction.on_commit(lambda: _queue_persist_token(user.pk, key))
+    return key
+
+
+def _queue_persist_token(user_id: int, key: str) -> None:
+    try:
+        persist_token_task.delay(user_id, key)
+    except Exception as e:
+        # The client is about to receive the key, so store it now instead
+        logger.warning(f"Could not queue token persistence for user {user_id}, storing it inline: {e}")
+        _get_or_insert_token_key(user_id, key)
+
+
+def get_or_create_token_cached(user) -> str:
+    """
+    Return the auth token key of a user whose token was not loaded with it.
+    
+    A key issued by issue_token_deferred and still waiting in the cache is
+    stored with the same single upsert that returns an existing token or
+    creates a new one, so the key the client already holds stays valid.
+    
+    Args:
+        user: The user to get the token for
+        
+    Returns:
+        The token key
+    """
+    try:
+        pending_key = cache.get(token_cache_key(user.pk))
+    except Exception as e:
+        logger.warning(f"Could not read the cached token of user {user.pk}: {e}")
+        pending_key = None
+    key = _get_or_insert_token_key(user.pk, pending_key or Token.generate_key())
+    try:
+        cache.set(token_cache_key(user.pk), key, timeout=TOKEN_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Could not cache the token of user {user.pk}: {e}")
+    return key
+
+
+def _get_or_insert_token_key(user_id: int, key: str) -> str:
+    # One atomic round-trip instead of SELECT + INSERT. The no-op DO UPDATE
+    # makes RETURNING yield the existing key when the user already has a token;
+    # otherwise ``key`` is stored. Idempotent with persist_token_task.
+    qn = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {qn(Token._meta.db_table)} ({qn('key')}, {qn('user_id')}, {qn('created')}) "
+        f"VALUES (%s, %s, %s) "
+        f"ON CONFLICT ({qn('user_id')}) DO UPDATE SET {qn('user_id')} = EXCLUDED.{qn('user_id')} "
+        f"RETURNING {qn('key')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [key, user_id, timezone.now()])
+        return cursor.fetchone()[0]
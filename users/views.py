@@ -1,54 +1,143 @@
+import orjson
 from rest_framework import status, generics
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
-from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
-from django.contrib.auth import login
-from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag
+from .serializers import (
+    UserRegistrationSerializer, UserLoginSerializer, UserSerializer, serialize_user_fast
+)
 from .models import CustomUser
+from .renderers import ORJSONRenderer
+from .utils import get_or_create_token_cached, issue_token_deferred
+
+# Shared serializers for the register/login hot path. Their fields are bound
+# once here instead of being deep-copied per request. Only run_validation()
+# and create() are called on them: both keep all state in locals, so the
+# instances are safe to share between threads (unlike is_valid(), which
+# stores initial_data and the results on the serializer).
+_REG_PROTO = UserRegistrationSerializer()
+_LOGIN_PROTO = UserLoginSerializer()
+
+
+def _json_response(data, status_code=status.HTTP_200_OK):
+    """
+    Render a payload made only of JSON-native types straight to a response.
+    
+    Skips DRF content negotiation and the renderer for responses whose shape
+    is fully controlled by the view; errors still go through DRF's Response.
+    """
+    return HttpResponse(orjson.dumps(data), status=status_code, content_type='application/json')
 
 
 class RegisterView(generics.CreateAPIView):
     """User registration endpoint."""
-    queryset = CustomUser.objects.all()
+    # Never evaluated by create(); only('pk') keeps any accidental fetch minimal
+    queryset = CustomUser.objects.only('pk')
     permission_classes = [AllowAny]
     serializer_class = UserRegistrationSerializer
+    renderer_classes = [ORJSONRenderer]
     
     def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
+        validated_data = _REG_PROTO.run_validation(request.data)
+        user = _REG_PROTO.create(validated_data)
+        
+        # The token row is written by a worker after commit; the key is usable
+        # straight away through the token caches
+        token_key = issue_token_deferred(user)
+        
+        return _json_response({
+            'user': serialize_user_fast(user),
+            'token': token_key
+        }, status_code=status.HTTP_201_CREATED)
+
+
+class BulkRegisterView(generics.GenericAPIView):
+    """Admin endpoint registering a list of users in one request."""
+    permission_classes = [IsAdminUser]
+    serializer_class = UserRegistrationSerializer
+    renderer_classes = [ORJSONRenderer]
+    
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
         
-        # Create token for the new user
-        token, created = Token.objects.get_or_create(user=user)
+        # Mirrors UserManager.create_user, without a round-trip per user
+        users = [
+            CustomUser(
+                username=CustomUser.normalize_username(data['username']),
+                email=CustomUser.objects.normalize_email(data['email']),
+                bio=data.get('bio', ''),
+                password=make_password(data['password']),
+            )
+            for data in serializer.validated_data
+        ]
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(users)
+                tokens = Token.objects.bulk_create([
+                    Token(user=user, key=Token.generate_key()) for user in users
+                ])
+        except IntegrityError:
+            # Duplicates within the payload are not caught by the unique validators
+            raise ValidationError('Usernames and emails must be unique')
         
-        return Response({
-            'user': UserSerializer(user).data,
-            'token': token.key
-        }, status=status.HTTP_201_CREATED)
+        return Response([
+            {'user': serialize_user_fast(user), 'token': token.key}
+            for user, token in zip(users, tokens)
+        ], status=status.HTTP_201_CREATED)
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def login_view(request):
+class LoginView(APIView):
     """User login endpoint."""
-    serializer = UserLoginSerializer(data=request.data)
-    if serializer.is_valid():
-        user = serializer.validated_data['user']
-        login(request, user)
-        token, created = Token.objects.get_or_create(user=user)
+    permission_classes = [AllowAny]
+    renderer_classes = [ORJSONRenderer]
+    
+    def post(self, request, *args, **kwargs):
+        try:
+            user = _LOGIN_PROTO.run_validation(request.data)['user']
+        except ValidationError as exc:
+            return Response(exc.detail, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Clients authenticate with the returned token, so no session is started.
+        # CustomUserManager.get_by_natural_key select_related()s auth_token for
+        # authenticate(), so an existing token costs no extra query here.
+        token = getattr(user, 'auth_token', None)
+        token_key = token.key if token is not None else get_or_create_token_cached(user)
         
-        return Response({
-            'user': UserSerializer(user).data,
-            'token': token.key
+        return _json_response({
+            'user': serialize_user_fast(user),
+            'token': token_key
         })
-    
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def profile_etag(request, *args, **kwargs):
+    """ETag of the authenticated user's profile; changes on every save."""
+    return f"{request.user.pk}-{request.user.updated_at.timestamp()}"
+
+
+# Unchanged profiles are answered with 304 before anything is serialized
+@method_decorator(etag(profile_etag), name='retrieve')
 class UserProfileView(generics.RetrieveUpdateAPIView):
     """User profile endpoint."""
     serializer_class = UserSerializer
+    renderer_classes = [ORJSONRenderer]
     
     def get_object(self):
-        return self.request.user 
\ No newline at end of file
+        if self.request.method in SAFE_METHODS:
+            # Already loaded, and usually cached, by CachedTokenAuthentication
+            return self.request.user
+        # save() writes every field, so start from the current row rather than
+        # the cached copy, which may predate QuerySet.update() calls
+        return CustomUser.objects.get(pk=self.request.user.pk)
+    
+    def retrieve(self, request, *args, **kwargs):
+        # Reads need no serializer; UserSerializer is only built for updates
+        return _json_response(serialize_user_fast(self.get_object()))
+ 
\ No newline at end of file